@@ -0,0 +1,132 @@
+import contextlib
+import io
+import os
+import time
+
+import pandas as pd
+
+import handle_cosmetics_dyson_game_market as handler
+
+# ========== 【基准测试配置区】 ==========
+BENCH_CONFIG = {
+    "source_file": handler.CONFIG["source_file"],  # 取样的行情表（不存在时只用规则描述里的示例）
+    "rounds": 200,  # 每种匹配方式重复跑样本的轮数
+    "include_rule_examples": True  # 把规则desc里"如xxx、yyy"的示例也加入样本
+}
+
+
+# ========== 样本收集函数 ==========
+def collect_rule_examples(rules):
+    """从规则描述的"（如A、B）"中提取示例行"""
+    return [example for rule in rules for example in handler.get_rule_examples(rule)]
+
+
+def collect_sheet_lines(source_path):
+    """读取行情表全部单元格，按换行拆成单行样本"""
+    if not os.path.exists(source_path):
+        print(f"⚠️ 未找到取样文件：{os.path.basename(source_path)}，仅使用规则示例")
+        return []
+    df = pd.read_excel(source_path, header=None, dtype=str, engine="openpyxl")
+    lines = []
+    for value in df.values.ravel():
+        if pd.isna(value):
+            continue
+        lines.extend(line.strip() for line in str(value).split("\n") if line.strip())
+    return lines
+
+
+# ========== 计时函数 ==========
+def time_per_line(func, lines, rounds):
+    """返回每行平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            func(line)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(lines)) * 1e6
+
+
+def time_process_single_line(engine, lines, rounds):
+    """按指定匹配方式跑完整的process_single_line（屏蔽逐行打印），返回每行平均耗时（微秒）"""
+    handler.CONFIG["rule_engine"] = engine
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for line in lines:
+                handler.process_single_line(line, "BENCH", 1, {"diff": 0})
+                sink.seek(0)
+                sink.truncate()
+        elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(lines)) * 1e6
+
+
+def check_same_rule(lines):
+    """确认两种匹配方式对每行命中同一条规则、提取同样的数字"""
+    mismatches = []
+    for line in lines:
+        seq_rule, seq_groups = handler.match_rule_sequential(line)
+        comb_rule, comb_groups = handler.match_rule_combined(line)
+        if seq_rule is not comb_rule or seq_groups != comb_groups:
+            mismatches.append((line, seq_rule, comb_rule))
+    return mismatches
+
+
+def check_shape_index_coverage(rules):
+    """确认每条规则在形状索引里至少有一个示例，否则相近规则建议永远不会给出它；返回缺示例的规则"""
+    indexed = {rule_idx for entries in handler.get_shape_index().values() for rule_idx, _, _ in entries}
+    return [rule for rule_idx, rule in enumerate(rules) if rule_idx not in indexed]
+
+
+# ========== 主函数 ==========
+def main():
+    source_path = os.path.join(os.path.abspath(os.getcwd()), BENCH_CONFIG["source_file"])
+    lines = collect_sheet_lines(source_path)
+    if BENCH_CONFIG["include_rule_examples"]:
+        lines.extend(collect_rule_examples(handler.CONFIG["regex_rules"]))
+    if not lines:
+        raise Exception("❌ 没有可用的样本行！")
+
+    rounds = BENCH_CONFIG["rounds"]
+    original_engine = handler.CONFIG.get("rule_engine", "combined")
+    segments = handler.get_compiled_rules()
+    print("=" * 80)
+    print("📌 规则匹配基准测试")
+    print(f"   规则数：{len(handler.CONFIG['regex_rules'])} | 合并后匹配段：{len(segments)} | "
+          f"样本行：{len(lines)} | 轮数：{rounds}")
+    print("=" * 80)
+
+    mismatches = check_same_rule(lines)
+    if mismatches:
+        print(f"\n❌ 两种匹配方式结果不一致（共{len(mismatches)}行）：")
+        for line, seq_rule, comb_rule in mismatches:
+            seq_desc = seq_rule["desc"] if seq_rule else "未匹配"
+            comb_desc = comb_rule["desc"] if comb_rule else "未匹配"
+            print(f"   {line}：逐条={seq_desc} | 合并={comb_desc}")
+    else:
+        print("\n✅ 两种匹配方式命中规则完全一致")
+
+    uncovered = check_shape_index_coverage(handler.CONFIG["regex_rules"])
+    if uncovered:
+        print("\n❌ 以下规则在形状索引中没有可用示例（请在desc里写\"如xxx\"或补充samples）：")
+        for rule in uncovered:
+            print(f"   {rule['desc']}")
+    else:
+        print("✅ 每条规则都有形状索引示例")
+
+    try:
+        seq_match = time_per_line(handler.match_rule_sequential, lines, rounds)
+        comb_match = time_per_line(handler.match_rule_combined, lines, rounds)
+        seq_line = time_process_single_line("sequential", lines, rounds)
+        comb_line = time_process_single_line("combined", lines, rounds)
+    finally:
+        handler.CONFIG["rule_engine"] = original_engine
+
+    print(f"\n📊 规则匹配耗时（每行）：逐条 {seq_match:.2f}μs | 合并 {comb_match:.2f}μs | "
+          f"提速 {seq_match / comb_match:.1f}倍")
+    print(f"📊 process_single_line耗时（每行）：逐条 {seq_line:.2f}μs | 合并 {comb_line:.2f}μs | "
+          f"提速 {seq_line / comb_line:.1f}倍")
+
+
+if __name__ == "__main__":
+    main()
+    print("\n🎉 基准测试结束！")
@@ -0,0 +1,276 @@
+import contextlib
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import pandas as pd
+
+import handle_cosmetics_dyson_game_market as handler
+import simulate_pricing_policy as simulate
+
+# ========== 【回归语料配置区】 ==========
+PARITY_CONFIG = {
+    "corpus_file": "pricing_corpus.jsonl",  # 金标语料（每行一个单元格：来源、位置、原值、金标结果）
+    # record模式下从这些行情表收录单元格，只能放本处理脚本负责的表（港药表规则和取整方式不同，不能混进来）
+    # 语料目前只是种子，日常新表持续record进来
+    "record_sources": [handler.CONFIG["source_file"]],
+    "reference_engine": "sequential",  # 旧引擎：录制金标、对照检查都以它为准
+    "candidate_engine": "combined",  # 新引擎：被检查的实现
+    "workers": None,  # 进程数，None=CPU核数
+    "chunk_size": 50  # 每个子任务处理的单元格数（语料较小时也要拆成多个子任务，才能真正用上进程池）
+}
+
+# 手写用例：行情表里少见、但最容易改坏的分支（固反/加号、括号数字、未匹配行），record模式一并收录
+SEED_CELLS = [
+    # 固反后接加号（同一单元格）
+    "固反837\n787+50",
+    "固反 851\n300 + 60",
+    "固反1500\n1200+300",
+    "固反1051\n980+100\n960+80",
+    "固反837\n\n787+50",
+    "固反837\n787+50\n固反1500\n600+100",
+    "固反837\n285无标\n787+50",
+    # 加号前没有固反
+    "787+50",
+    "787+50\n固反837",
+    "300+60\n固反837\n300+60",
+    "0+0",
+    # 固反差值<=0（加号行保持不变）
+    "固反0\n120+30",
+    "固反40\n300+50",
+    "固反49\n100+20",
+    "固反50\n100+20",
+    # 括号数字
+    "（400）",
+    "(1234)",
+    "（85）\n(1050)",
+    "（400）\n固反837\n787+50",
+    # 未匹配行
+    "12寸0?",
+    "abc",
+    "固反837元",
+    "1W3-185",
+    "固反837\nabc\n787+50",
+    "???\n500",
+    # 纯数字/纯中文/空白行
+    "  500  ",
+    "500\n\n无货",
+    "崩，没卖"
+]
+
+
+# ========== 语料读写函数 ==========
+def load_corpus(corpus_path):
+    if not os.path.exists(corpus_path):
+        return []
+    with open(corpus_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_corpus(corpus_path, records):
+    # 固定排序+固定键顺序，保证同样的语料每次写出的文件完全一致
+    records = sorted(records, key=lambda r: (r["source"], r["pos"], r["value"]))
+    with open(corpus_path, "w", encoding="utf-8", newline="\n") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+
+
+def read_sheet_cells(source_path):
+    """读取行情表处理范围内的全部非空单元格，返回 [(单元格位置, 原值)]"""
+    df = pd.read_excel(source_path, header=None, dtype=str, engine="openpyxl")
+    start_row_idx, end_row_idx, start_col_idx, end_col_idx = handler.get_process_range(df.shape)
+    cells = []
+    for row_idx in range(start_row_idx, end_row_idx + 1):
+        for col_idx in range(start_col_idx, end_col_idx + 1):
+            value = df.iloc[row_idx, col_idx]
+            if pd.isna(value) or str(value).strip() == "":
+                continue
+            cells.append((handler.get_cell_pos(row_idx, col_idx), str(value)))
+    return cells
+
+
+def build_seed_cells():
+    """
+    生成用例单元格，返回 [(来源, 位置, 原值)]
+    包括手写用例、每条规则的示例（单独一格、以及夹在固反/加号行之间）、固反×加号数值组合、取整/阈值附近的纯数字
+    """
+    cells = [("手写用例", value) for value in SEED_CELLS]
+    examples = [example for rule in handler.CONFIG["regex_rules"] for example in handler.get_rule_examples(rule)]
+    cells.extend(("规则示例", example) for example in examples)
+    gufan_values = [0, 1, 9, 10, 40, 49, 50, 51, 99, 100, 149, 150, 151, 837, 999, 1000, 1001, 1010, 1049, 1050,
+                    1051, 1099, 1100, 1500, 9999]
+    cells.extend(("规则示例", f"固反{gufan_values[idx % len(gufan_values)]}\n{example}\n300+60")
+                 for idx, example in enumerate(examples))
+    cells.extend(("固反加号组合", f"固反{gufan}\n500+{plus}")
+                 for gufan in gufan_values for plus in [0, 1, 5, 9, 10, 11, 50, 99, 100, 1000])
+    # 0~1200覆盖四舍五入的.5边界和差值阈值（1000附近）
+    cells.extend(("纯数字边界", str(num)) for num in range(1201))
+    return [(source, f"#{idx}", value) for idx, (source, value) in enumerate(cells, 1)]
+
+
+# ========== 引擎调用函数 ==========
+def run_engine(engine, value, pos):
+    handler.CONFIG["rule_engine"] = engine
+    processed, _ = handler.process_cell(value, pos)
+    return processed
+
+
+def describe_line_rule(line_str):
+    """说明单行走的是哪条处理分支/规则，用于差异报告"""
+    line_stripped = line_str.strip()
+    if line_stripped == "":
+        return "空行"
+    if handler.is_pure_number(line_stripped):
+        return "纯数字"
+    if handler.is_pure_chinese(line_stripped):
+        return "纯中文"
+    rule, _ = handler.match_regex_rule(line_stripped)
+    return rule["desc"] if rule else "未匹配"
+
+
+def _silence_worker():
+    # 子进程的逐行处理日志没有意义，直接丢弃
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+
+
+def check_chunk(records):
+    """子进程：对一批语料分别跑新旧引擎，返回有差异的记录"""
+    diffs = []
+    for record in records:
+        reference = run_engine(PARITY_CONFIG["reference_engine"], record["value"], record["pos"])
+        candidate = run_engine(PARITY_CONFIG["candidate_engine"], record["value"], record["pos"])
+        if candidate == record["expected"] and candidate == reference:
+            continue
+
+        line_diffs = []
+        input_lines = record["value"].split("\n")
+        expected_lines = record["expected"].split("\n")
+        reference_lines = reference.split("\n")
+        candidate_lines = candidate.split("\n")
+        for idx, line in enumerate(input_lines):
+            expected_line = expected_lines[idx] if idx < len(expected_lines) else None
+            reference_line = reference_lines[idx] if idx < len(reference_lines) else None
+            candidate_line = candidate_lines[idx] if idx < len(candidate_lines) else None
+            if candidate_line == expected_line and candidate_line == reference_line:
+                continue
+            handler.CONFIG["rule_engine"] = PARITY_CONFIG["reference_engine"]
+            reference_rule = describe_line_rule(line)
+            handler.CONFIG["rule_engine"] = PARITY_CONFIG["candidate_engine"]
+            candidate_rule = describe_line_rule(line)
+            line_diffs.append({
+                "line_num": idx + 1,
+                "content": line,
+                "expected": expected_line,
+                "reference": reference_line,
+                "candidate": candidate_line,
+                "reference_rule": reference_rule,
+                "candidate_rule": candidate_rule
+            })
+        diffs.append({**record, "reference": reference, "candidate": candidate, "line_diffs": line_diffs})
+    return diffs
+
+
+# ========== 模式函数 ==========
+def record_corpus(corpus_path):
+    """把行情表和用例里语料中还没有的单元格加入语料，金标结果用旧引擎生成；已有记录不改动"""
+    records = load_corpus(corpus_path)
+    known_values = {record["value"] for record in records}
+    added = 0
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        candidates = []
+        for source_file in PARITY_CONFIG["record_sources"]:
+            source_path = os.path.join(os.path.abspath(os.getcwd()), source_file)
+            handler.check_file_exists(source_path, "取样文件")
+            candidates.extend((source_file, pos, value) for pos, value in read_sheet_cells(source_path))
+        candidates.extend(build_seed_cells())
+        for source, pos, value in candidates:
+            if value in known_values:
+                continue
+            known_values.add(value)
+            records.append({
+                "source": source,
+                "pos": pos,
+                "value": value,
+                "expected": run_engine(PARITY_CONFIG["reference_engine"], value, pos)
+            })
+            added += 1
+    save_corpus(corpus_path, records)
+    print(f"✅ 语料已更新：新增{added}条，共{len(records)}条 → {os.path.basename(corpus_path)}")
+
+
+def check_corpus(corpus_path):
+    """多进程跑完整个语料，返回全部差异记录"""
+    records = load_corpus(corpus_path)
+    if not records:
+        raise Exception(f"❌ 语料为空或不存在，请先运行record模式！路径：{corpus_path}")
+
+    chunk_size = PARITY_CONFIG["chunk_size"]
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+    print(f"🔍 开始对比（{len(records)}条语料，{len(chunks)}个子任务）...")
+    diffs = []
+    with Pool(PARITY_CONFIG["workers"], initializer=_silence_worker) as pool:
+        for chunk_diffs in pool.imap(check_chunk, chunks):
+            diffs.extend(chunk_diffs)
+
+    print(f"\n📋 差异报告（共{len(diffs)}个单元格）：")
+    if not diffs:
+        print("  ✨ 新旧引擎与金标结果完全一致！")
+    for idx, diff in enumerate(diffs, 1):
+        print(f"\n  {idx}. {diff['source']} 单元格：{diff['pos']}")
+        for line_diff in diff["line_diffs"]:
+            print(f"     第{line_diff['line_num']}行：{line_diff['content']}")
+            print(f"       金标={line_diff['expected']} | 旧引擎={line_diff['reference']}"
+                  f"（{line_diff['reference_rule']}） | 新引擎={line_diff['candidate']}"
+                  f"（{line_diff['candidate_rule']}）")
+    return diffs
+
+
+def check_simulation(corpus_path):
+    """
+    定价模拟按当前方案（CONFIG["adjust_config"]）在语料上重算，结果应与金标（process_cell的输出）完全一致，
+    防止simulate_pricing_policy里按缓存重算的逻辑和process_single_line悄悄分叉；返回不一致的记录
+    """
+    records = load_corpus(corpus_path)
+    # 每条语料单独一行、中间隔一个空行，row/block范围的跨单元格处理不会串到别的语料
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        cache = [simulate.build_cache_entry(idx * 2, 0, record["value"]) for idx, record in enumerate(records)]
+    results, _, _ = simulate.apply_scenario(cache, handler.CONFIG["adjust_config"])
+    sim_diffs = [{**record, "simulated": content}
+                 for record, (content, _) in zip(records, results) if content != record["expected"]]
+
+    print(f"\n📋 定价模拟对照（当前方案，共{len(sim_diffs)}个单元格不一致）：")
+    if not sim_diffs:
+        print("  ✨ 模拟结果与金标结果完全一致！")
+    for idx, diff in enumerate(sim_diffs, 1):
+        print(f"\n  {idx}. {diff['source']} 单元格：{diff['pos']}")
+        print(f"     原值：{diff['value']!r}")
+        print(f"     金标={diff['expected']!r} | 模拟={diff['simulated']!r}")
+    return sim_diffs
+
+
+# ========== 主函数 ==========
+def main():
+    # 用法：python check_pricing_parity.py [record|check]，默认check
+    mode = sys.argv[1] if len(sys.argv) > 1 else "check"
+    corpus_path = os.path.join(os.path.abspath(os.getcwd()), PARITY_CONFIG["corpus_file"])
+    print("=" * 80)
+    print(f"📌 定价回归对比（模式：{mode}）")
+    print(f"   旧引擎：{PARITY_CONFIG['reference_engine']} | 新引擎：{PARITY_CONFIG['candidate_engine']}")
+    print(f"   语料文件：{corpus_path}")
+    print("=" * 80)
+
+    if mode == "record":
+        record_corpus(corpus_path)
+        return 0
+    if mode == "check":
+        diffs = check_corpus(corpus_path)
+        sim_diffs = check_simulation(corpus_path)
+        return 1 if diffs or sim_diffs else 0
+    raise Exception(f"❌ 未知模式：{mode}（可选record/check）")
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    print("\n🎉 脚本结束！")
+    sys.exit(exit_code)
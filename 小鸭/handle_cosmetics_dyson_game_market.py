@@ -1,6 +1,13 @@
+import contextlib
+import csv
+import io
+import json
+import mmap
 import os
 import re
 import sys
+import time
+from multiprocessing import Pool
 
 import pandas as pd
 
@@ -52,12 +59,14 @@ CONFIG = {
         {
             "pattern": r"^兜底(?P<number>\d+)$",
             "num_groups": ["number"],
-            "desc": "兜底 + 数字"
+            "desc": "兜底 + 数字",
+            "samples": ["兜底500"]  # desc里没有示例的规则在这里补充，供相近规则建议使用
         },
         {
             "pattern": r"^(?P<number>\d+)\s*(-|/)\s*(1W0|1W2)$",
             "num_groups": ["number"],
-            "desc": "数字 + -|/ + 1W0|1W2"
+            "desc": "数字 + -|/ + 1W0|1W2",
+            "samples": ["185-1W0", "200/1W2"]
         },
         {
             "pattern": r"^(1W0|1W2)\s*(-|/)\s*(?P<number>\d+)$",
@@ -143,7 +152,8 @@ CONFIG = {
         {
             "pattern": r"^(?P<number>\d+)\s*[PX]+$",
             "num_groups": ["number"],
-            "desc": "数字 + PX"
+            "desc": "数字 + PX",
+            "samples": ["320PX"]
         },
         {
             "pattern": r"^(?P<number>\d+)\s*([一二三四五六七八九十]{1,2})代\s*(\s*[-/]\s*\d+年)?$",
@@ -190,14 +200,40 @@ CONFIG = {
     "adjust_config": {
         "rate_value": 0.99,  # 数字调整乘数（修改此处调整乘值）
         "threshold": 10,  # 差值阈值（修改此处调整判断条件）
-        "sub_value": 10  # 超过阈值的减值（修改此处调整减值）
+        "sub_value": 10,  # 超过阈值的减值（修改此处调整减值）
+        "rounding": "integer"  # 取整方式：integer=四舍五入取整，half=四舍五入到0.5
     },
     "process_whole_table": True,
     "target_cols": [3, 4, 5],  # 处理列：C/D/E列（Excel列号）
     "start_row": 4,  # 处理起始行（Excel行号）
-    "ignore_date": False
+    "ignore_date": False,
+    "rule_engine": "combined",  # 规则匹配方式：combined=合并正则一次匹配，sequential=逐条匹配（旧逻辑）
+    "gufan_scope": "cell",  # 固反差值传给加号行的范围：cell=同一单元格，row=同一行，block=同一列连续非空单元格（商品块）
+    # CSV/TSV源文件（按扩展名识别）走分片并行处理，不整表读入内存
+    "csv_config": {
+        "encoding": "utf-8-sig",  # 文件编码（utf-8-sig兼容Excel导出带BOM的CSV）
+        "shard_size_mb": 16,  # 每个分片的目标大小（MB），分片结尾对齐到记录边界
+        "workers": None  # 并行进程数，None=CPU核数
+    },
+    # 运行报告：各阶段耗时、处理数量、内存峰值（关闭时不做任何计时）
+    "run_report": {
+        "enabled": False,  # True=运行结束时打印报告
+        "save_json": False  # True=同时在目标文件旁写出"<目标文件名>_运行报告.json"
+    },
+    # 未匹配行的相近规则建议：按"数字/中文/分隔符/单位"形状和规则desc里的示例比对
+    "rule_suggestions": {
+        "enabled": True,
+        "top_n": 3  # 每行最多列出的相近规则数
+    }
 }
 
+# 有特殊逻辑的规则（按desc识别）：固反行算出差值，后续加号行的第二个数字减去该差值
+GUFAN_RULE_DESC = "固反数字（如固反837）"
+PLUS_RULE_DESC = "数字+加号+数字（如787+50）"
+
+# CSV/TSV扩展名对应的分隔符
+CSV_DELIMITERS = {".csv": ",", ".tsv": "\t"}
+
 
 # ========== 辅助函数 ==========
 def is_pure_number(s):
@@ -217,15 +253,47 @@ def is_pure_chinese(s):
         return False
 
 
-def adjust_number(num_str):
+def round_to_half(num):
+    """
+    四舍五入到最近的0.5
+    示例：38.115 → 38.0，11.385→11.5，41.58→41.5，12.87→13.0
+    """
+    return round(num * 2) / 2
+
+
+# 取整方式（adjust_config["rounding"]的可选值）及说明
+ROUNDING_MODES = {"integer": "四舍五入取整", "half": "四舍五入到0.5"}
+
+
+def get_rounding_mode(adjust_cfg=None):
+    """返回取整方式；不是可选值时报错，不静默按整数取整"""
+    adjust_cfg = adjust_cfg or CONFIG["adjust_config"]
+    rounding = adjust_cfg.get("rounding", "integer")
+    if rounding not in ROUNDING_MODES:
+        raise Exception(f"❌ rounding只能是{'/'.join(ROUNDING_MODES)}：{rounding}")
+    return rounding
+
+
+def round_price(num, adjust_cfg=None):
+    """按取整方式处理价格，返回 (数值, 输出文本)"""
+    if get_rounding_mode(adjust_cfg) == "half":
+        final_num = round_to_half(num)
+        # 38.0→38，38.5保持0.5格式
+        return final_num, f"{final_num:.1f}".rstrip('0').rstrip('.')
+    final_num = round(num)
+    return final_num, str(final_num)
+
+
+def adjust_number(num_str, adjust_cfg=None):
     """
     数字核心调整逻辑（修改此处可调整数字处理规则）：
     1. 原数字 * rate_value
     2. 计算原数字与临时值的差值
     3. 差值>threshold → 原数字 - sub_value；否则用临时值
-    4. 四舍五入取整，返回处理后数字+实际差值
+    4. 按rounding取整（默认四舍五入取整），返回处理后数字+实际差值
+    :param adjust_cfg: 调整参数，默认用CONFIG["adjust_config"]（模拟时传入不同方案）
     """
-    adjust_cfg = CONFIG["adjust_config"]
+    adjust_cfg = adjust_cfg or CONFIG["adjust_config"]
     try:
         num = float(num_str)
         original_num = num
@@ -237,21 +305,353 @@ def adjust_number(num_str):
         else:
             new_num = temp_num
 
-        final_num = round(new_num)
+        final_num, final_str = round_price(new_num, adjust_cfg)
         actual_diff = original_num - final_num
-        return str(final_num), actual_diff
+        return final_str, actual_diff
     except Exception as e:
         print(f"⚠️ 数字【{num_str}】调整失败：{str(e)}")
         return None, 0
 
 
+def find_number_spans(original_str, num_str):
+    """
+    数字可被替换的位置列表 [(起始, 结束)]，按替换优先级排列：括号内的数字在前，其次是独立数字（避免子集数字，如1234中的123）
+    """
+    paren_spans = [m.span() for m in re.finditer(rf'(?<=[（(]){re.escape(num_str)}(?=[）)])', original_str)]
+    plain_spans = [m.span() for m in re.finditer(rf'(?<!\d){re.escape(num_str)}(?!\d)', original_str)]
+    return paren_spans + [span for span in plain_spans if span not in paren_spans]
+
+
 def safe_replace_number(original_str, num_str, new_num):
     """安全替换数字，避免子集数字误替换（如1234中的123）"""
-    pattern = rf'(?<=[（(]){re.escape(num_str)}(?=[）)])'
-    # 如果匹配不到括号内的数字，再用原规则匹配独立数字
-    if not re.search(pattern, original_str):
-        pattern = rf'(?<!\d){re.escape(num_str)}(?!\d)'
-    return re.sub(pattern, new_num, original_str, count=1)
+    spans = find_number_spans(original_str, num_str)
+    if not spans:
+        return original_str
+    start, end = spans[0]
+    return original_str[:start] + new_num + original_str[end:]
+
+
+# ========== 规则编译函数（合并正则） ==========
+# 可以写成作用域内联标志的规则flags，其余flags的规则回退为逐条匹配
+_SCOPED_FLAG_LETTERS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s", re.VERBOSE: "x"}
+_NAMED_GROUP_RE = re.compile(r"\(\?P<(?P<name>[A-Za-z_]\w*)>")
+_NAMED_REF_RE = re.compile(r"\(\?P=(?P<name>[A-Za-z_]\w*)\)")
+_NUMBERED_REF_RE = re.compile(r"(?<!\\)(?:\\\\)*\\(?:[1-9]|g<\d+>)")
+
+# 编译结果缓存：规则表对象不变时复用
+_COMPILED_RULES_CACHE = {"rules": None, "segments": None}
+
+
+def _rule_merge_blocker(rule):
+    """返回规则不能并入合并正则的原因，可合并时返回None"""
+    pattern = rule["pattern"]
+    flags = rule.get("flags", 0)
+    if flags & ~sum(_SCOPED_FLAG_LETTERS):
+        return "含无法内联的flags"
+    if _NUMBERED_REF_RE.search(pattern):
+        return "含编号反向引用，改名分组后编号会错位"
+    try:
+        standalone = re.compile(pattern, flags)
+        wrapped = re.compile(_wrap_rule_pattern(rule, "r00"))
+    except re.error as e:
+        return f"嵌入合并正则后无法编译（{e}）"
+    # 外层命名分组只多出1个分组，否则说明嵌入后结构变了
+    if wrapped.groups != standalone.groups + 1:
+        return "嵌入合并正则后分组数量不一致"
+    return None
+
+
+def _wrap_rule_pattern(rule, tag):
+    """把单条规则改写成合并正则中的一个分支：(?P<tag>...)，命名分组统一加tag前缀"""
+    pattern = _NAMED_GROUP_RE.sub(lambda m: f"(?P<{tag}_{m.group('name')}>", rule["pattern"])
+    pattern = _NAMED_REF_RE.sub(lambda m: f"(?P={tag}_{m.group('name')})", pattern)
+    letters = "".join(letter for flag, letter in _SCOPED_FLAG_LETTERS.items() if rule.get("flags", 0) & flag)
+    if letters:
+        pattern = f"(?{letters}:{pattern})"
+    return f"(?P<{tag}>{pattern})"
+
+
+def compile_regex_rules(rules):
+    """
+    把规则表编译成按顺序尝试的匹配段：
+    1. 连续的可合并规则编成一个合并正则，每条规则是一个命名分支（如(?P<r07>...)），数字分组改名为r07_number
+    2. Python正则的分支按书写顺序尝试，配合fullmatch时命中的一定是第一条能完整匹配的规则，
+       规则之间有重叠也保持"先匹配先生效"
+    3. 嵌入后语义可能变化的规则（编号反向引用、无法内联的flags、嵌入后编译失败）单独成段逐条匹配，
+       段与段之间仍按规则表顺序尝试
+    :return: 匹配段列表，每段为 {"regex": 编译后的正则, "branches": {分支名: (规则, 分组名映射)}}
+             或 {"regex": 编译后的正则, "rule": 规则}（逐条匹配段）
+    """
+    segments = []
+    pending = []  # 待合并的 (分支名, 规则)
+
+    def flush_pending():
+        if not pending:
+            return
+        branches = {}
+        for tag, rule in pending:
+            group_names = _NAMED_GROUP_RE.findall(rule["pattern"])
+            branches[tag] = (rule, {name: f"{tag}_{name}" for name in group_names})
+        combined = "|".join(_wrap_rule_pattern(rule, tag) for tag, rule in pending)
+        segments.append({"regex": re.compile(combined), "branches": branches})
+        pending.clear()
+
+    for idx, rule in enumerate(rules):
+        blocker = _rule_merge_blocker(rule)
+        if blocker:
+            print(f"⚠️ 规则【{rule['desc']}】{blocker}，改为逐条匹配")
+            flush_pending()
+            segments.append({"regex": re.compile(rule["pattern"], rule.get("flags", 0)), "rule": rule})
+        else:
+            pending.append((f"r{idx:02d}", rule))
+    flush_pending()
+    return segments
+
+
+def get_compiled_rules():
+    """取当前CONFIG规则表的编译结果（规则表替换后自动重新编译）"""
+    rules = CONFIG["regex_rules"]
+    if _COMPILED_RULES_CACHE["rules"] is not rules:
+        _COMPILED_RULES_CACHE["segments"] = compile_regex_rules(rules)
+        _COMPILED_RULES_CACHE["rules"] = rules
+    return _COMPILED_RULES_CACHE["segments"]
+
+
+def match_rule_sequential(line_stripped):
+    """旧逻辑：按规则表顺序逐条fullmatch，返回 (命中规则, 命名分组dict)，未命中返回 (None, None)"""
+    for rule in CONFIG["regex_rules"]:
+        flags = rule.get("flags", 0)
+        match = re.fullmatch(rule["pattern"], line_stripped, flags=flags)
+        if match:
+            return rule, match.groupdict()
+    return None, None
+
+
+def match_rule_combined(line_stripped):
+    """合并正则匹配：每个匹配段一次fullmatch，返回值同match_rule_sequential"""
+    for segment in get_compiled_rules():
+        match = segment["regex"].fullmatch(line_stripped)
+        if not match:
+            continue
+        if "rule" in segment:
+            return segment["rule"], match.groupdict()
+        # 外层分支分组最后闭合，lastgroup即命中的规则分支名
+        rule, group_map = segment["branches"][match.lastgroup]
+        return rule, {name: match.group(renamed) for name, renamed in group_map.items()}
+    return None, None
+
+
+def match_regex_rule(line_stripped):
+    """按CONFIG["rule_engine"]选择匹配方式"""
+    if CONFIG.get("rule_engine", "combined") == "sequential":
+        return match_rule_sequential(line_stripped)
+    return match_rule_combined(line_stripped)
+
+
+def classify_line(line_str):
+    """
+    只做分类不做调整，供模拟等需要复用解析结果的场景使用，分支与process_single_line一致
+    :return: {"kind": blank/pure_number/pure_chinese/gufan/plus/rule/unmatched,
+              "rule": 命中规则, "numbers": [(分组名, 数字串)],
+              "spans": 与numbers一一对应，process_single_line替换该数字时在line_str中的位置(起始, 结束)，
+                        纯数字（整行替换）和加号行第一个数字为None}
+    """
+    line_stripped = line_str.strip()
+    if line_stripped == "":
+        return {"kind": "blank", "rule": None, "numbers": [], "spans": []}
+    if is_pure_number(line_stripped):
+        return {"kind": "pure_number", "rule": None, "numbers": [(None, line_stripped)], "spans": [None]}
+    if is_pure_chinese(line_stripped):
+        return {"kind": "pure_chinese", "rule": None, "numbers": [], "spans": []}
+
+    rule, groups = match_regex_rule(line_stripped)
+    if not rule:
+        return {"kind": "unmatched", "rule": None, "numbers": [], "spans": []}
+    if rule["desc"] == GUFAN_RULE_DESC:
+        kind, group_names = "gufan", ["number"]
+    elif rule["desc"] == PLUS_RULE_DESC:
+        kind, group_names = "plus", ["number1", "number2"]
+    else:
+        kind, group_names = "rule", rule["num_groups"]
+    numbers = [(name, groups.get(name)) for name in group_names if groups.get(name)]
+    # 按process_single_line的顺序逐个替换：每个数字取替换时的第一个可替换位置，已替换过的位置不再参与
+    # （加号行第一个数字保持不变，不占位置）
+    spans = []
+    replaced = set()
+    for name, num_str in numbers:
+        if kind == "plus" and name == "number1":
+            spans.append(None)
+            continue
+        span = next((span for span in find_number_spans(line_str, num_str) if span not in replaced), None)
+        spans.append(span)
+        replaced.add(span)
+    return {"kind": kind, "rule": rule, "numbers": numbers, "spans": spans}
+
+
+# ========== 相近规则建议函数 ==========
+# 形状分词：数字串、单位、中文串、英文串、其余单字符（分隔符/括号等），空白不计
+_SHAPE_TOKEN_RE = re.compile(
+    r"(?P<digit>\d+)|(?P<unit>(?:ml|mg|g|m)(?![A-Za-z])|年|月)|(?P<cjk>[\u4e00-\u9fa5]+)|(?P<latin>[A-Za-z]+)|(?P<space>\s+)"
+    r"|(?P<sep>.)", re.IGNORECASE)
+_SHAPE_LABELS = {"digit": "数字", "unit": "单位", "cjk": "中文", "latin": "英文", "sep": "符号"}
+
+# 形状索引缓存：规则表对象不变时复用
+_SHAPE_INDEX_CACHE = {"rules": None, "index": None}
+
+
+def get_rule_examples(rule):
+    """规则的示例：规则描述"（如A、B）"中的示例，加上规则里samples补充的示例"""
+    examples = []
+    found = re.search(r"如(.+)[）)]$", rule["desc"])
+    if found:
+        examples = [item.strip() for item in found.group(1).split("、") if item.strip()]
+    return examples + rule.get("samples", [])
+
+
+def tokenize_shape(line_stripped):
+    """
+    把一行拆成形状片段 [(类别, 比对键, 原文, 起始, 结束)]
+    数字/中文/英文只比类别，单位和符号连原文一起比（"-"和"/"、"年"和"月"算不同）
+    """
+    tokens = []
+    for match in _SHAPE_TOKEN_RE.finditer(line_stripped):
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        text = match.group()
+        key = f"{kind}:{text.lower()}" if kind in ("unit", "sep") else kind
+        tokens.append((kind, key, text, match.start(), match.end()))
+    return tokens
+
+
+def get_shape_index():
+    """
+    预先算好每条规则接受的形状：用规则desc里的示例和samples，只收录规则自身能完整匹配的示例
+    :return: {形状签名: [(规则序号, 示例, 示例片段)]}
+    """
+    rules = CONFIG["regex_rules"]
+    if _SHAPE_INDEX_CACHE["rules"] is not rules:
+        index = {}
+        for rule_idx, rule in enumerate(rules):
+            for example in get_rule_examples(rule):
+                if not re.fullmatch(rule["pattern"], example, flags=rule.get("flags", 0)):
+                    continue
+                tokens = tokenize_shape(example)
+                signature = tuple(token[1] for token in tokens)
+                index.setdefault(signature, []).append((rule_idx, example, tokens))
+        _SHAPE_INDEX_CACHE["index"] = index
+        _SHAPE_INDEX_CACHE["rules"] = rules
+    return _SHAPE_INDEX_CACHE["index"]
+
+
+def _shape_alignment(source_sig, target_sig):
+    """
+    两个形状签名的加权编辑距离及对齐方式
+    同类别不同原文（如"-"和"/"）替换代价0.5，其余增/删/替换代价1
+    :return: (距离, 对齐列表[(行片段下标或None, 示例片段下标或None)])
+    """
+    def sub_cost(i, j):
+        if source_sig[i] == target_sig[j]:
+            return 0
+        return 0.5 if source_sig[i].split(":")[0] == target_sig[j].split(":")[0] else 1
+
+    rows, cols = len(source_sig), len(target_sig)
+    dist = [[0.0] * (cols + 1) for _ in range(rows + 1)]
+    for i in range(1, rows + 1):
+        dist[i][0] = float(i)
+    for j in range(1, cols + 1):
+        dist[0][j] = float(j)
+    for i in range(1, rows + 1):
+        for j in range(1, cols + 1):
+            dist[i][j] = min(dist[i - 1][j - 1] + sub_cost(i - 1, j - 1), dist[i - 1][j] + 1, dist[i][j - 1] + 1)
+
+    # 从终点回溯出对齐方式
+    pairs = []
+    i, j = rows, cols
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and dist[i][j] == dist[i - 1][j - 1] + sub_cost(i - 1, j - 1):
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i > 0 and dist[i][j] == dist[i - 1][j] + 1:
+            pairs.append((i - 1, None))
+            i -= 1
+        else:
+            pairs.append((None, j - 1))
+            j -= 1
+    pairs.reverse()
+    return dist[rows][cols], pairs
+
+
+def _describe_break(line_stripped, line_tokens, rule, example, example_tokens, pairs):
+    """
+    找出导致不匹配的片段：从示例出发按对齐顺序逐个换成本行的片段，
+    第一个换上后规则就匹配不上的片段即为原因
+    每个片段连同它前面的空白一起换（空白取自片段所在的原文），空白导致的不匹配也能定位到片段
+    """
+    def with_gap(text, tokens, idx):
+        return text[tokens[idx - 1][4] if idx > 0 else 0:tokens[idx][4]]
+
+    def build(split_at):
+        parts = []
+        for pos, (line_idx, example_idx) in enumerate(pairs):
+            if pos < split_at:
+                parts.append(with_gap(line_stripped, line_tokens, line_idx) if line_idx is not None else "")
+            else:
+                parts.append(with_gap(example, example_tokens, example_idx) if example_idx is not None else "")
+        return "".join(parts)
+
+    flags = rule.get("flags", 0)
+    for pos, (line_idx, example_idx) in enumerate(pairs):
+        if re.fullmatch(rule["pattern"], build(pos + 1), flags=flags):
+            continue
+        if example_idx is None:
+            return f"多出{_SHAPE_LABELS[line_tokens[line_idx][0]]}片段「{line_tokens[line_idx][2]}」"
+        if line_idx is None:
+            return f"缺少{_SHAPE_LABELS[example_tokens[example_idx][0]]}片段（示例为「{example_tokens[example_idx][2]}」）"
+        return f"片段「{line_tokens[line_idx][2]}」不符合规则（示例为「{example_tokens[example_idx][2]}」）"
+    return "片段与示例逐一对应，但空白或整体组合不符合规则"
+
+
+def suggest_rules(line_str, top_n=3, _signature_cache=None):
+    """
+    给未匹配行找最相近的规则
+    :param _signature_cache: 批量调用时共享的 {形状签名: 各规则最近示例} 缓存，同形状的行只算一次距离
+    :return: [{"desc": 规则描述, "example": 最近示例, "distance": 形状距离, "break": 不匹配原因}]
+    """
+    line_stripped = line_str.strip()
+    line_tokens = tokenize_shape(line_stripped)
+    signature = tuple(token[1] for token in line_tokens)
+    if _signature_cache is not None and signature in _signature_cache:
+        nearest = _signature_cache[signature]
+    else:
+        best_per_rule = {}
+        for example_sig, entries in get_shape_index().items():
+            distance, pairs = _shape_alignment(signature, example_sig)
+            for rule_idx, example, example_tokens in entries:
+                if rule_idx not in best_per_rule or distance < best_per_rule[rule_idx][0]:
+                    best_per_rule[rule_idx] = (distance, example, example_tokens, pairs)
+        # 距离相同时按规则表顺序
+        nearest = sorted(best_per_rule.items(), key=lambda item: (item[1][0], item[0]))[:top_n]
+        if _signature_cache is not None:
+            _signature_cache[signature] = nearest
+
+    rules = CONFIG["regex_rules"]
+    return [{
+        "desc": rules[rule_idx]["desc"],
+        "example": example,
+        "distance": distance,
+        "break": _describe_break(line_stripped, line_tokens, rules[rule_idx], example, example_tokens, pairs)
+    } for rule_idx, (distance, example, example_tokens, pairs) in nearest]
+
+
+def attach_rule_suggestions(error_logs):
+    """对整批异常里未匹配的行补充相近规则建议（写入行异常信息的suggestions）"""
+    top_n = CONFIG["rule_suggestions"]["top_n"]
+    signature_cache = {}
+    for error_info in error_logs:
+        for line_info in error_info["error_lines"]:
+            if line_info["reason"] == "未匹配指定格式":
+                line_info["suggestions"] = suggest_rules(line_info["content"], top_n, signature_cache)
 
 
 # ========== 单行处理函数 ==========
@@ -261,19 +661,26 @@ def process_single_line(line_str, cell_pos, line_num, diff_cache=None):
     :param line_str: 单行内容
     :param cell_pos: 单元格位置（如C4）
     :param line_num: 单元格内的行号
-    :param diff_cache: 缓存固反行差值（格式：{'diff': 差值}）
+    :param diff_cache: 缓存固反行差值（格式：{'diff': 差值, 'gufan_seen': 是否出现过固反行,
+                       'pending_plus': [(行号, 第二个数字)] 本单元格固反行之前、等待跨单元格差值的加号行}）
     :return: 处理后内容、错误信息、固反差值
     """
     # 修复：先去除首尾空白，再处理（避免换行/空格导致匹配失败）
     line_stripped = line_str.strip()
+    if RUN_STATS["enabled"]:
+        _count("lines")
     if line_stripped == "":
         return line_str, None, 0
 
     # 纯数字/纯中文（含标点）直接处理
-    if is_pure_number(line_stripped):
-        new_num, _ = adjust_number(line_stripped)
+    with run_stage("classify"):
+        pure_number = is_pure_number(line_stripped)
+        pure_chinese = not pure_number and is_pure_chinese(line_stripped)
+    if pure_number:
+        with run_stage("adjust"):
+            new_num, _ = adjust_number(line_stripped)
         return new_num if new_num else line_str, None, 0
-    if is_pure_chinese(line_stripped):
+    if pure_chinese:
         return line_str, None, 0
 
     processed_line = line_str
@@ -282,61 +689,71 @@ def process_single_line(line_str, cell_pos, line_num, diff_cache=None):
     match_desc = ""
     gufan_diff = 0
 
-    # 遍历正则规则匹配
-    for rule in CONFIG["regex_rules"]:
-        flags = rule.get("flags", 0)
-        match = re.fullmatch(rule["pattern"], line_stripped, flags=flags)
-        if match:
-            match_flag = True
-            match_desc = rule["desc"]
+    # 匹配正则规则（首个命中的规则生效）
+    with run_stage("classify"):
+        rule, groups = match_regex_rule(line_stripped)
+    if RUN_STATS["enabled"]:
+        _count("rule_matched" if rule else "rule_unmatched")
+    if rule:
+        match_flag = True
+        match_desc = rule["desc"]
 
-            # 固反数字特殊处理：计算差值并缓存
-            if match_desc == "固反数字（如固反837）":
-                num_str = match.group("number")
-                if num_str:
-                    print(f"📌 单元格{cell_pos}第{line_num}行：匹配到固反数字={num_str}，内容={line_str}")
+        # 固反数字特殊处理：计算差值并缓存
+        if match_desc == GUFAN_RULE_DESC:
+            num_str = groups.get("number")
+            if num_str:
+                print(f"📌 单元格{cell_pos}第{line_num}行：匹配到固反数字={num_str}，内容={line_str}")
+                with run_stage("adjust"):
                     new_num, actual_diff = adjust_number(num_str)
-                    if new_num:
+                if new_num:
+                    with run_stage("replace"):
                         processed_line = safe_replace_number(processed_line, num_str, new_num)
-                        gufan_diff = actual_diff
-                        if diff_cache is not None:
-                            diff_cache["diff"] = actual_diff
-                        print(f"✅ 固反处理后={processed_line}，差值={actual_diff}")
-                    else:
-                        unprocessed_nums.append(num_str)
+                    gufan_diff = actual_diff
+                    if diff_cache is not None:
+                        diff_cache["diff"] = actual_diff
+                        diff_cache["gufan_seen"] = True
+                    print(f"✅ 固反处理后={processed_line}，差值={actual_diff}")
+                else:
+                    unprocessed_nums.append(num_str)
 
-            # 加号数字特殊处理：第一个数字不变，第二个减固反差值
-            elif match_desc == "数字+加号+数字（如787+50）":
-                num1_str = match.group("number1")
-                num2_str = match.group("number2")
-                if num1_str and num2_str:
-                    print(f"📌 单元格{cell_pos}第{line_num}行：匹配到加号数字={num1_str}+{num2_str}，内容={line_str}")
-                    if diff_cache and diff_cache.get("diff", 0) > 0:
-                        sub_diff = diff_cache["diff"]
-                        try:
-                            num2 = float(num2_str) - sub_diff
-                            new_num2 = str(round(num2))
+        # 加号数字特殊处理：第一个数字不变，第二个减固反差值
+        elif match_desc == PLUS_RULE_DESC:
+            num1_str = groups.get("number1")
+            num2_str = groups.get("number2")
+            if num1_str and num2_str:
+                print(f"📌 单元格{cell_pos}第{line_num}行：匹配到加号数字={num1_str}+{num2_str}，内容={line_str}")
+                if diff_cache and diff_cache.get("diff", 0) > 0:
+                    sub_diff = diff_cache["diff"]
+                    try:
+                        with run_stage("adjust"):
+                            _, new_num2 = round_price(float(num2_str) - sub_diff)
+                        with run_stage("replace"):
                             processed_line = safe_replace_number(processed_line, num2_str, new_num2)
-                            print(f"✅ 加号处理后={processed_line}（第二个数字减差值{sub_diff}）")
-                        except Exception as e:
-                            print(f"⚠️ 单元格{cell_pos}第{line_num}行：加号数字处理失败{str(e)}")
-                            unprocessed_nums.append(num2_str)
-                    else:
-                        print(f"⚠️ 单元格{cell_pos}第{line_num}行：未找到固反差值，加号行数字保持不变")
+                        print(f"✅ 加号处理后={processed_line}（第二个数字减差值{sub_diff}）")
+                    except Exception as e:
+                        print(f"⚠️ 单元格{cell_pos}第{line_num}行：加号数字处理失败{str(e)}")
+                        unprocessed_nums.append(num2_str)
+                elif diff_cache is not None and not diff_cache.get("gufan_seen") and CONFIG["gufan_scope"] != "cell":
+                    # 本单元格内前面没有固反行，留给依赖处理阶段用同行/同商品块的固反差值
+                    diff_cache.setdefault("pending_plus", []).append((line_num, num2_str))
+                    print(f"⏳ 单元格{cell_pos}第{line_num}行：本单元格未找到固反差值，等待跨单元格处理")
+                else:
+                    print(f"⚠️ 单元格{cell_pos}第{line_num}行：未找到固反差值，加号行数字保持不变")
 
-            # 通用规则处理
-            else:
-                for group_name in rule["num_groups"]:
-                    num_str = match.group(group_name)
-                    if num_str:
-                        print(f"📌 单元格{cell_pos}第{line_num}行：匹配到{group_name}={num_str}，内容={line_str}")
+        # 通用规则处理
+        else:
+            for group_name in rule["num_groups"]:
+                num_str = groups.get(group_name)
+                if num_str:
+                    print(f"📌 单元格{cell_pos}第{line_num}行：匹配到{group_name}={num_str}，内容={line_str}")
+                    with run_stage("adjust"):
                         new_num, _ = adjust_number(num_str)
-                        if new_num:
+                    if new_num:
+                        with run_stage("replace"):
                             processed_line = safe_replace_number(processed_line, num_str, new_num)
-                            print(f"✅ 替换后={processed_line}")
-                        else:
-                            unprocessed_nums.append(num_str)
-            break
+                        print(f"✅ 替换后={processed_line}")
+                    else:
+                        unprocessed_nums.append(num_str)
 
     # 未匹配规则标error
     if not match_flag:
@@ -364,15 +781,23 @@ def process_single_line(line_str, cell_pos, line_num, diff_cache=None):
 
 
 # ========== 单元格处理函数 ==========
-def process_cell(cell_value, cell_pos):
+def process_cell(cell_value, cell_pos, cell_state=None):
+    """
+    处理单个单元格（两遍处理中的第一遍，各单元格互不依赖，可并行）
+    :param cell_state: 传入空dict时填入本格的处理状态，供resolve_gufan_dependencies做跨单元格处理；
+                       空单元格保持为空dict
+    :return: 处理后内容、错误信息
+    """
     if pd.isna(cell_value) or (isinstance(cell_value, str) and cell_value.strip() == ""):
         return cell_value, None
+    if RUN_STATS["enabled"]:
+        _count("cells")
 
     cell_str = str(cell_value)
     lines = cell_str.split('\n')
     processed_lines = []
     cell_error_infos = []
-    diff_cache = {"diff": 0}  # 缓存固反行差值，供加号行使用
+    diff_cache = {"diff": 0, "gufan_seen": False, "pending_plus": []}  # 缓存固反行差值，供加号行使用
 
     for idx, line in enumerate(lines, 1):
         processed_line, line_error_info, _ = process_single_line(line, cell_pos, idx, diff_cache)
@@ -392,9 +817,67 @@ def process_cell(cell_value, cell_pos):
             "reason": f"共{len(cell_error_infos)}行异常：{'; '.join(error_details)}"
         }
 
+    if cell_state is not None:
+        cell_state.update({"pos": cell_pos, "lines": processed_lines, "changed": False, **diff_cache})
     return final_content, final_error_info
 
 
+# ========== 跨单元格依赖处理函数 ==========
+def _apply_gufan_carry(cell_state, carry_diff, adjust_cfg=None):
+    """
+    把传入的固反差值用到本格等待中的加号行，返回传给下一个单元格的差值
+    处理过的加号行记入cell_state["carried_plus"]：[(行号, 原第二个数字, 新第二个数字)]
+    """
+    if carry_diff is not None and carry_diff > 0 and cell_state["pending_plus"]:
+        carried_plus = cell_state.setdefault("carried_plus", [])
+        for line_num, num2_str in cell_state["pending_plus"]:
+            final_num, new_num2 = round_price(float(num2_str) - carry_diff, adjust_cfg)
+            carried_plus.append((line_num, num2_str, final_num))
+            line_idx = line_num - 1
+            cell_state["lines"][line_idx] = safe_replace_number(cell_state["lines"][line_idx], num2_str, new_num2)
+            print(f"✅ 单元格{cell_state['pos']}第{line_num}行：加号处理后={cell_state['lines'][line_idx]}"
+                  f"（第二个数字减跨单元格固反差值{carry_diff}）")
+        cell_state["pending_plus"] = []
+        cell_state["changed"] = True
+    # 本格有固反行时，后续单元格用本格最后一个固反差值
+    return cell_state["diff"] if cell_state["gufan_seen"] else carry_diff
+
+
+def resolve_gufan_dependencies(cell_grid, scope, column_carry=None, adjust_cfg=None):
+    """
+    依赖处理（第二遍）：把固反差值传给其他单元格里等待中的加号行，改动过的单元格状态标记changed
+    每个加号行用同一范围内、它前面最近的一个固反行差值：
+    - cell：只在单元格内传递（第一遍已处理完，这里不做事）
+    - row：同一行从左到右传递
+    - block：同一列从上到下传递，遇到空单元格视为商品块结束
+    :param cell_grid: 按行排列的单元格状态二维列表，空单元格/不处理的单元格为None
+    :param column_carry: block范围下每列延续的差值{列号: 差值}，会就地更新为末行之后的状态（分片处理时逐片传递）
+    :param adjust_cfg: 加号行取整用的调整参数，None时用CONFIG["adjust_config"]（定价模拟按方案传入）
+    """
+    if scope == "cell":
+        return
+    if scope == "row":
+        for row_states in cell_grid:
+            carry_diff = None
+            for cell_state in row_states:
+                if cell_state is not None:
+                    carry_diff = _apply_gufan_carry(cell_state, carry_diff, adjust_cfg)
+    elif scope == "block":
+        column_carry = {} if column_carry is None else column_carry
+        for row_states in cell_grid:
+            for col_idx, cell_state in enumerate(row_states):
+                if cell_state is None:
+                    column_carry[col_idx] = None
+                else:
+                    column_carry[col_idx] = _apply_gufan_carry(cell_state, column_carry.get(col_idx), adjust_cfg)
+            # CSV短行缺的列按空单元格处理
+            for col_idx in column_carry:
+                if col_idx >= len(row_states):
+                    column_carry[col_idx] = None
+    else:
+        raise Exception(f"❌ gufan_scope只能是cell/row/block：{scope}")
+
+
 # ========== 路径/文件处理函数 ==========
 def get_abs_paths():
     current_dir = os.path.abspath(os.getcwd())
@@ -413,51 +896,210 @@ def clear_old_target_file(target_path):
             raise Exception(f"❌ 请先关闭Excel中的【{os.path.basename(target_path)}】文件！")
 
 
+def get_cell_pos(row_idx, col_idx):
+    """0起始的行列索引转Excel单元格位置（如A1、AB12）"""
+    col_name = ""
+    col_num = col_idx + 1
+    while col_num > 0:
+        col_num, remainder = divmod(col_num - 1, 26)
+        col_name = chr(65 + remainder) + col_name
+    return f"{col_name}{row_idx + 1}"
+
+
 def check_file_exists(file_path, desc):
     if not os.path.exists(file_path):
         raise Exception(f"❌ {desc}不存在！路径：{file_path}")
     print(f"✅ 找到{desc}：{os.path.basename(file_path)}")
 
 
-# ========== 主函数 ==========
-def main():
-    source_path, target_path = get_abs_paths()
-    print("=" * 80)
-    print("📌 表格数字批量调整脚本")
-    print(
-        f"   调整规则：先乘{CONFIG['adjust_config']['rate_value']}，差值>{CONFIG['adjust_config']['threshold']}则减{CONFIG['adjust_config']['sub_value']}，最终四舍五入取整")
-    print(f"   源文件：{source_path} | 目标文件：{target_path}")
-    print("=" * 80)
+# ========== 运行统计函数 ==========
+RUN_STATS = {"enabled": False, "stages": {}, "counters": {}, "worker_peak_mb": None}
+
+# 报告里的阶段名称（按输出顺序）；classify/adjust/replace是逐格处理内部的细分，print为全程终端打印
+STAGE_NAMES = {
+    "check": "文件检查",
+    "split": "切分分片",
+    "read": "读取",
+    "cells": "逐格处理",
+    "classify": "  ├ 分类/规则匹配",
+    "adjust": "  ├ 数字调整",
+    "replace": "  └ 数字替换",
+    "resolve": "跨单元格处理",
+    "write": "写出",
+    "suggest": "相近规则建议",
+    "report": "异常报告",
+    "print": "终端打印（全程）"
+}
 
-    check_file_exists(source_path, "源文件")
-    clear_old_target_file(target_path)
+_NO_STAGE = contextlib.nullcontext()
 
-    error_logs = []
+
+def run_stage(name):
+    """阶段计时：with run_stage("read"): ...；统计关闭时返回同一个空上下文，几乎没有开销"""
+    if not RUN_STATS["enabled"]:
+        return _NO_STAGE
+    return _timed_stage(name)
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        RUN_STATS["stages"][name] = RUN_STATS["stages"].get(name, 0) + time.perf_counter() - start
+
+
+def _count(name, amount=1):
+    RUN_STATS["counters"][name] = RUN_STATS["counters"].get(name, 0) + amount
+
+
+class _TimedStdout:
+    """终端打印计时：包住原来的stdout，写出耗时计入print阶段；只在main运行期间使用，结束后换回原stdout"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        with _timed_stage("print"):
+            return self.stream.write(text)
+
+    def flush(self):
+        with _timed_stage("print"):
+            return self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def enable_run_stats():
+    """开启运行统计并清空已有数据；各阶段在调用处用run_stage计时，计数在函数内按RUN_STATS["enabled"]判断"""
+    RUN_STATS.update({"enabled": True, "stages": {}, "counters": {}, "worker_peak_mb": None})
+
+
+def collect_worker_stats():
+    """子进程：取出本进程累计的统计并清零，随分片结果交给主进程合并"""
+    if not RUN_STATS["enabled"]:
+        return None
+    stats = {"stages": RUN_STATS["stages"], "counters": RUN_STATS["counters"], "peak_mb": get_peak_memory_mb()}
+    RUN_STATS["stages"], RUN_STATS["counters"] = {}, {}
+    return stats
+
+
+def merge_worker_stats(stats):
+    """主进程：合并子进程的统计（耗时为各进程累计，内存取最大值）"""
+    if not stats:
+        return
+    for name, seconds in stats["stages"].items():
+        RUN_STATS["stages"][name] = RUN_STATS["stages"].get(name, 0) + seconds
+    for name, amount in stats["counters"].items():
+        _count(name, amount)
+    if stats["peak_mb"] is not None:
+        RUN_STATS["worker_peak_mb"] = max(RUN_STATS["worker_peak_mb"] or 0, stats["peak_mb"])
+
+
+def get_peak_memory_mb():
+    """当前进程的内存峰值（MB），取不到时返回None"""
     try:
-        # 读取Excel：保留原始格式，强制字符串类型避免自动转换
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class ProcessMemoryCounters(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            ctypes.windll.kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            ctypes.windll.psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD]
+            ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                     ctypes.byref(counters), counters.cb)
+            return counters.PeakWorkingSetSize / 1024 / 1024
+
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS单位是字节，Linux是KB
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return None
+
+
+def print_run_report(target_path, total_seconds):
+    """打印运行报告，按配置写出JSON"""
+    stages = RUN_STATS["stages"]
+    counters = RUN_STATS["counters"]
+    report = {
+        "total_seconds": round(total_seconds, 4),
+        "stages": {name: round(stages[name], 4) for name in STAGE_NAMES if name in stages},
+        "counters": {
+            "cells": counters.get("cells", 0),
+            "lines": counters.get("lines", 0),
+            "rule_matched": counters.get("rule_matched", 0),
+            "rule_unmatched": counters.get("rule_unmatched", 0)
+        },
+        "peak_memory_mb": get_peak_memory_mb(),
+        "worker_peak_memory_mb": RUN_STATS["worker_peak_mb"]
+    }
+
+    print(f"\n⏱️ 运行报告（总耗时{total_seconds:.2f}s）：")
+    for name, label in STAGE_NAMES.items():
+        if name in report["stages"]:
+            print(f"   {label}：{report['stages'][name]:.3f}s")
+    if RUN_STATS["worker_peak_mb"] is not None:
+        print("   （CSV分片模式下读取、逐格处理为各子进程累计耗时）")
+    print(f"   单元格{report['counters']['cells']}个 | 行{report['counters']['lines']}行 | "
+          f"规则命中{report['counters']['rule_matched']}次 | 未匹配{report['counters']['rule_unmatched']}次")
+    memory_parts = []
+    if report["peak_memory_mb"] is not None:
+        memory_parts.append(f"主进程{report['peak_memory_mb']:.1f}MB")
+    if report["worker_peak_memory_mb"] is not None:
+        memory_parts.append(f"子进程最高{report['worker_peak_memory_mb']:.1f}MB")
+    if memory_parts:
+        print(f"   内存峰值：{' | '.join(memory_parts)}")
+
+    if CONFIG["run_report"]["save_json"]:
+        report_path = f"{os.path.splitext(target_path)[0]}_运行报告.json"
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"   报告已保存至：{report_path}")
+
+
+# ========== Excel处理函数 ==========
+def get_process_range(shape):
+    """按配置确定处理范围，返回0起始的 (起始行, 结束行, 起始列, 结束列)，均含端点"""
+    if CONFIG["process_whole_table"]:
+        return 0, shape[0] - 1, 0, shape[1] - 1
+    return CONFIG["start_row"] - 1, shape[0] - 1, min(CONFIG["target_cols"]) - 1, max(CONFIG["target_cols"]) - 1
+
+
+def process_excel_file(source_path, target_path):
+    """整表读入Excel逐格处理后写出，返回异常日志"""
+    error_logs = []
+    # 读取Excel：保留原始格式，强制字符串类型避免自动转换
+    with run_stage("read"):
         df = pd.read_excel(source_path, header=None, dtype=str, engine="openpyxl")
 
-        # 确定处理范围
-        if CONFIG["process_whole_table"]:
-            start_row_idx = 0
-            end_row_idx = df.shape[0] - 1
-            start_col_idx = 0
-            end_col_idx = df.shape[1] - 1
-        else:
-            start_row_idx = CONFIG["start_row"] - 1
-            end_row_idx = df.shape[0] - 1
-            start_col_idx = min(CONFIG["target_cols"]) - 1
-            end_col_idx = max(CONFIG["target_cols"]) - 1
+    # 确定处理范围
+    start_row_idx, end_row_idx, start_col_idx, end_col_idx = get_process_range(df.shape)
 
-        # 进度计算
-        total_cells = (end_row_idx - start_row_idx + 1) * (end_col_idx - start_col_idx + 1)
-        processed_cells = 0
+    # 进度计算
+    total_cells = (end_row_idx - start_row_idx + 1) * (end_col_idx - start_col_idx + 1)
+    processed_cells = 0
 
-        print(
-            f"\n🔍 开始处理（范围：Excel行{start_row_idx + 1}-{end_row_idx + 1}，列{start_col_idx + 1}-{end_col_idx + 1}，共{total_cells}个单元格）...")
+    print(
+        f"\n🔍 开始处理（范围：Excel行{start_row_idx + 1}-{end_row_idx + 1}，列{start_col_idx + 1}-{end_col_idx + 1}，共{total_cells}个单元格）...")
 
-        # 遍历处理单元格
+    # 第一遍：逐格处理，记录固反差值和等待中的加号行
+    cell_grid = []
+    with run_stage("cells"):
         for row_idx in range(start_row_idx, end_row_idx + 1):
+            row_states = []
+            cell_grid.append(row_states)
             for col_idx in range(start_col_idx, end_col_idx + 1):
                 processed_cells += 1
                 # 进度提示
@@ -467,32 +1109,291 @@ def main():
                     sys.stdout.flush()
 
                 # 转换为Excel单元格位置（如A1）
-                cell_pos = f"{chr(64 + col_idx + 1)}{row_idx + 1}"
+                cell_pos = get_cell_pos(row_idx, col_idx)
                 cell_value = df.iloc[row_idx, col_idx]
-                processed_val, error_info = process_cell(cell_value, cell_pos)
+                cell_state = {}
+                processed_val, error_info = process_cell(cell_value, cell_pos, cell_state)
                 df.iloc[row_idx, col_idx] = processed_val
+                row_states.append(cell_state or None)
                 if error_info:
                     error_logs.append(error_info)
 
-        # 写入处理后的文件
+    # 第二遍：按gufan_scope把固反差值传给其他单元格的加号行
+    with run_stage("resolve"):
+        resolve_gufan_dependencies(cell_grid, CONFIG["gufan_scope"])
+        for row_offset, row_states in enumerate(cell_grid):
+            for col_offset, cell_state in enumerate(row_states):
+                if cell_state and cell_state["changed"]:
+                    df.iloc[start_row_idx + row_offset, start_col_idx + col_offset] = '\n'.join(cell_state["lines"])
+
+    # 写入处理后的文件
+    with run_stage("write"):
         df.to_excel(target_path, index=False, header=False, engine="openpyxl")
-        check_file_exists(target_path, "目标文件")
+    return error_logs
+
+
+# ========== CSV/TSV分片处理函数 ==========
+def get_csv_delimiter(file_path):
+    """按扩展名判断是否为CSV/TSV，返回分隔符；Excel文件返回None"""
+    return CSV_DELIMITERS.get(os.path.splitext(file_path)[1].lower())
+
+
+def _quote_start_regex(delimiter):
+    """
+    匹配"字段开头的双引号"：和csv方言一致，只有紧跟在分隔符/换行/文件开头（可带BOM）后的双引号才开始引号字段
+    普通字段中间的双引号（如 12"寸）只是字面字符，不影响引号状态
+    """
+    field_sep = re.escape(delimiter.encode())
+    return re.compile(rb'(?:(?<=[' + field_sep + rb'\n])|\A(?:\xef\xbb\xbf)?)"')
+
+
+def _skip_quoted_field(mm, quote_pos):
+    """从引号字段的开引号出发，返回闭引号之后的位置（""是转义，不算闭合）；引号没闭合时返回文件结尾"""
+    size = len(mm)
+    pos = quote_pos + 1
+    while True:
+        close_pos = mm.find(b'"', pos)
+        if close_pos == -1:
+            return size
+        if mm[close_pos + 1:close_pos + 2] == b'"':
+            pos = close_pos + 2
+            continue
+        return close_pos + 1
+
+
+def _next_record_start(mm, pos, target, quote_start_re):
+    """
+    pos是某条记录的开头；往后扫描，返回第一个不小于target的记录开头位置
+    引号字段整体跳过（里面的换行不是记录结尾），两个引号字段之间的换行都是记录结尾
+    """
+    size = len(mm)
+    while True:
+        match = quote_start_re.search(mm, pos)
+        quote_pos = match.end() - 1 if match else size
+        newline_from = max(pos, target - 1)
+        if newline_from < quote_pos:
+            newline_pos = mm.find(b"\n", newline_from, quote_pos)
+            if newline_pos != -1:
+                return newline_pos + 1
+        if quote_pos >= size:
+            return size
+        pos = _skip_quoted_field(mm, quote_pos)
+
+
+def split_csv_shards(mm, shard_size, header_rows, delimiter):
+    """
+    按记录边界把文件切成字节区间分片，返回 [(起始, 结束, 是否原样输出)]
+    前header_rows条记录（处理起始行之前）单独成片原样输出；其余分片约shard_size字节，结尾对齐到记录边界
+    切分点从上一个切分点顺序扫描得到，引号状态按csv方言判断，所以单元格内换行和字段中间的双引号都不会切错
+    """
+    size = len(mm)
+    quote_start_re = _quote_start_regex(delimiter)
+    shards = []
+    pos = 0
+    for _ in range(header_rows):
+        if pos < size:
+            pos = _next_record_start(mm, pos, pos + 1, quote_start_re)
+    if pos > 0:
+        shards.append((0, pos, True))
+
+    while pos < size:
+        start = pos
+        target = start + shard_size
+        pos = _next_record_start(mm, start, target, quote_start_re) if target < size else size
+        shards.append((start, pos, False))
+    return shards
+
+
+def _shard_encoding(start, source_has_bom=True):
+    # utf-8-sig只在文件开头有BOM：中间分片、以及源文件本身没有BOM时，按普通utf-8编码（不给输出凭空加BOM）
+    encoding = CONFIG["csv_config"]["encoding"]
+    if (start > 0 or not source_has_bom) and encoding.lower().replace("_", "-") == "utf-8-sig":
+        return "utf-8"
+    return encoding
+
+
+def _init_worker(stats_enabled):
+    # 多进程时各分片的逐行日志会交错在一起，子进程里直接丢弃，异常统一由主进程打印
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    if stats_enabled:
+        enable_run_stats()
+
+
+def process_csv_shard(task):
+    """
+    子进程：处理一个分片（第一遍），返回 (处理后的行, 记录数, 异常列表, 单元格状态二维表, 运行统计)
+    异常列表元素为 (分片内行号, 列号, 异常信息)，单元格位置由主进程换算成全表位置
+    gufan_scope为cell时不需要跨单元格处理，状态表返回None；原样输出的分片返回 (原始字节, None, [], None, None)
+    运行统计未开启时为None
+    """
+    source_path, start, end, passthrough, delimiter = task
+    with run_stage("read"):
+        with open(source_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            raw = mm[start:end]
+        if passthrough:
+            return raw, None, [], None, None
+        # 解码和CSV解析都算读取阶段，逐格处理阶段只含process_cell
+        source_rows = list(csv.reader(io.StringIO(raw.decode(_shard_encoding(start)), newline=""),
+                                      delimiter=delimiter))
+    keep_states = CONFIG["gufan_scope"] != "cell"
+    if CONFIG["process_whole_table"]:
+        col_range = None
+    else:
+        col_range = range(min(CONFIG["target_cols"]) - 1, max(CONFIG["target_cols"]))
+
+    rows = []
+    cell_grid = [] if keep_states else None
+    shard_errors = []
+    with run_stage("cells"):
+        for local_row_idx, row in enumerate(source_rows):
+            row_states = [None] * len(row)
+            for col_idx, cell_value in enumerate(row):
+                if col_range is not None and col_idx not in col_range:
+                    continue
+                cell_state = {}
+                processed_val, error_info = process_cell(cell_value, get_cell_pos(local_row_idx, col_idx), cell_state)
+                row[col_idx] = processed_val
+                row_states[col_idx] = cell_state or None
+                if error_info:
+                    shard_errors.append((local_row_idx, col_idx, error_info))
+            rows.append(row)
+            if keep_states:
+                cell_grid.append(row_states)
+    return rows, len(rows), shard_errors, cell_grid, collect_worker_stats()
+
+
+def _relocate_error(error_info, new_pos):
+    """把分片内的单元格位置换成全表位置"""
+    old_pos = error_info["pos"]
+    error_info["pos"] = new_pos
+    for line_info in error_info["error_lines"]:
+        line_info["pos"] = new_pos + line_info["pos"][len(old_pos):]
+    return error_info
+
+
+def process_csv_file(source_path, target_path):
+    """
+    CSV/TSV模式：mmap源文件按记录边界切片，多进程逐片调用process_cell，主进程按原顺序做跨单元格处理并拼接输出，返回异常日志
+    大文件不会整表读入内存，带换行的单元格（引号内换行）不会被切开
+    """
+    error_logs = []
+    delimiter = get_csv_delimiter(source_path)
+    csv_cfg = CONFIG["csv_config"]
+    header_rows = 0 if CONFIG["process_whole_table"] else CONFIG["start_row"] - 1
+
+    if os.path.getsize(source_path) == 0:
+        open(target_path, "wb").close()
+        return error_logs
+
+    with run_stage("split"), open(source_path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        first_newline = mm.find(b"\n")
+        line_terminator = "\r\n" if first_newline > 0 and mm[first_newline - 1:first_newline] == b"\r" else "\n"
+        source_has_bom = mm[:3] == b"\xef\xbb\xbf"
+        shards = split_csv_shards(mm, int(csv_cfg["shard_size_mb"] * 1024 * 1024), header_rows, delimiter)
+
+    print(f"\n🔍 开始处理（CSV/TSV分片模式：共{len(shards)}个分片，跳过前{header_rows}行）...")
+    tasks = [(source_path, start, end, passthrough, delimiter) for start, end, passthrough in shards]
+    row_offset = 0
+    column_carry = {}  # block范围下跨分片延续的每列固反差值
+    with Pool(csv_cfg["workers"], initializer=_init_worker, initargs=(RUN_STATS["enabled"],)) as pool, \
+            open(target_path, "wb") as target:
+        results = pool.imap(process_csv_shard, tasks)
+        for done, (task, (data, row_count, shard_errors, cell_grid, stats)) in enumerate(zip(tasks, results), 1):
+            merge_worker_stats(stats)
+            if row_count is None:  # 原样输出的表头分片
+                with run_stage("write"):
+                    target.write(data)
+                row_offset += header_rows
+                continue
+
+            # 第二遍：分片按顺序在主进程做跨单元格依赖处理
+            if cell_grid is not None:
+                with run_stage("resolve"):
+                    for local_row_idx, row_states in enumerate(cell_grid):
+                        for col_idx, cell_state in enumerate(row_states):
+                            if cell_state and cell_state["pending_plus"]:
+                                cell_state["pos"] = get_cell_pos(row_offset + local_row_idx, col_idx)
+                    resolve_gufan_dependencies(cell_grid, CONFIG["gufan_scope"], column_carry)
+                    for local_row_idx, row_states in enumerate(cell_grid):
+                        for col_idx, cell_state in enumerate(row_states):
+                            if cell_state and cell_state["changed"]:
+                                data[local_row_idx][col_idx] = "\n".join(cell_state["lines"])
+
+            with run_stage("write"):
+                output = io.StringIO(newline="")
+                csv.writer(output, delimiter=delimiter, lineterminator=line_terminator).writerows(data)
+                target.write(output.getvalue().encode(_shard_encoding(task[1], source_has_bom)))
+            for local_row_idx, col_idx, error_info in shard_errors:
+                error_logs.append(_relocate_error(error_info, get_cell_pos(row_offset + local_row_idx, col_idx)))
+            row_offset += row_count
+            sys.stdout.write(f"\r📊 进度：{done}/{len(tasks)}个分片 ({done / len(tasks) * 100:.1f}%)")
+            sys.stdout.flush()
+    return error_logs
+
+
+# ========== 主函数 ==========
+def main():
+    if CONFIG["run_report"]["enabled"]:
+        enable_run_stats()
+    run_start = time.perf_counter()
+    source_path, target_path = get_abs_paths()
+    rounding_desc = ROUNDING_MODES[get_rounding_mode()]
+    print("=" * 80)
+    print("📌 表格数字批量调整脚本")
+    print(
+        f"   调整规则：先乘{CONFIG['adjust_config']['rate_value']}，差值>{CONFIG['adjust_config']['threshold']}则减{CONFIG['adjust_config']['sub_value']}，最终{rounding_desc}")
+    print(f"   源文件：{source_path} | 目标文件：{target_path}")
+    print("=" * 80)
+
+    with run_stage("check"):
+        check_file_exists(source_path, "源文件")
+        clear_old_target_file(target_path)
+
+    if RUN_STATS["enabled"]:
+        # 终端打印计时：处理期间把stdout换成计时包装，结束时换回
+        sys.stdout = _TimedStdout(sys.stdout)
+    try:
+        # CSV/TSV走分片并行模式，其余按Excel处理
+        if get_csv_delimiter(source_path):
+            error_logs = process_csv_file(source_path, target_path)
+        else:
+            error_logs = process_excel_file(source_path, target_path)
+        with run_stage("write"):
+            check_file_exists(target_path, "目标文件")
 
         print(f"\n\n✅ 处理完成！文件已保存至：{target_path}")
 
+        if CONFIG["rule_suggestions"]["enabled"]:
+            with run_stage("suggest"):
+                attach_rule_suggestions(error_logs)
+
         # 打印异常日志
-        print(f"\n📋 异常日志（共{len(error_logs)}个单元格）：")
-        if error_logs:
-            for idx, log in enumerate(error_logs, 1):
-                print(f"\n  {idx}. 单元格：{log['pos']}")
-                print(f"     原始内容：{log['content']}")
-                print(f"     异常原因：{log['reason']}")
-        else:
-            print(f"  ✨ 无异常！")
+        with run_stage("report"):
+            print(f"\n📋 异常日志（共{len(error_logs)}个单元格）：")
+            if error_logs:
+                for idx, log in enumerate(error_logs, 1):
+                    print(f"\n  {idx}. 单元格：{log['pos']}")
+                    print(f"     原始内容：{log['content']}")
+                    print(f"     异常原因：{log['reason']}")
+                    for line_info in log["error_lines"]:
+                        if line_info.get("suggestions"):
+                            print(f"     {line_info['pos']}「{line_info['content'].strip()}」相近规则：")
+                            for suggestion in line_info["suggestions"]:
+                                print(f"       - {suggestion['desc']}：示例「{suggestion['example']}」，"
+                                      f"{suggestion['break']}")
+            else:
+                print(f"  ✨ 无异常！")
+
+        if RUN_STATS["enabled"]:
+            print_run_report(target_path, time.perf_counter() - run_start)
 
     except Exception as e:
         print(f"\n❌ 执行出错：{str(e)}")
         raise
+    finally:
+        if isinstance(sys.stdout, _TimedStdout):
+            sys.stdout = sys.stdout.stream
 
 
 if __name__ == "__main__":
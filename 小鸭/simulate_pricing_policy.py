@@ -0,0 +1,267 @@
+import contextlib
+import json
+import os
+import time
+
+import pandas as pd
+
+import handle_cosmetics_dyson_game_market as handler
+
+# ========== 【定价模拟配置区】 ==========
+SIM_CONFIG = {
+    "source_file": handler.CONFIG["source_file"],  # 要模拟的行情表
+    "scenario_file": "pricing_scenarios.json",  # 方案文件（列表，每项可覆盖adjust_config的任意参数）
+    "target_suffix": "_模拟对比",  # 对比结果文件后缀
+    "watch": False,  # True=解析一次后持续监听方案文件，修改保存后自动重算（Ctrl+C退出）
+    "watch_interval": 1  # 监听间隔（秒）
+}
+
+
+# ========== 方案读取函数 ==========
+def load_scenarios(scenario_path):
+    """读取方案文件，未写的参数沿用CONFIG["adjust_config"]；写了adjust_config里没有的参数（多半是拼错）直接报错"""
+    with open(scenario_path, encoding="utf-8") as f:
+        raw_scenarios = json.load(f)
+    scenarios = []
+    for idx, raw in enumerate(raw_scenarios, 1):
+        unknown_keys = [k for k in raw if k != "name" and k not in handler.CONFIG["adjust_config"]]
+        if unknown_keys:
+            raise Exception(f"❌ 方案{idx}有未知参数：{'、'.join(unknown_keys)}"
+                            f"（可选：name、{'、'.join(handler.CONFIG['adjust_config'])}）")
+        adjust_cfg = {**handler.CONFIG["adjust_config"], **{k: v for k, v in raw.items() if k != "name"}}
+        if adjust_cfg.get("rounding", "integer") not in handler.ROUNDING_MODES:
+            raise Exception(f"❌ 方案{idx}的rounding只能是{'/'.join(handler.ROUNDING_MODES)}：{adjust_cfg['rounding']}")
+        scenarios.append({"name": raw.get("name", f"方案{idx}"), "adjust_config": adjust_cfg})
+    return scenarios
+
+
+# ========== 解析缓存函数 ==========
+def build_cache_entry(row_idx, col_idx, cell_value):
+    """对一个单元格逐行分类，缓存数字、数字在行内的位置和命中规则"""
+    lines = []
+    for line in str(cell_value).split("\n"):
+        info = handler.classify_line(line)
+        lines.append({
+            "line": line,
+            "kind": info["kind"],
+            "rule_desc": info["rule"]["desc"] if info["rule"] else "",
+            "numbers": [num_str for _, num_str in info["numbers"]],
+            "spans": info["spans"]
+        })
+    return {"pos": handler.get_cell_pos(row_idx, col_idx), "row_idx": row_idx, "col_idx": col_idx,
+            "original": str(cell_value), "lines": lines}
+
+
+def build_cache(source_path):
+    """
+    读表并对处理范围内每个单元格做一次分类
+    之后每个方案只在缓存上重算，不再读表、不再跑正则（新数字按缓存的位置直接拼进行里）
+    """
+    df = pd.read_excel(source_path, header=None, dtype=str, engine="openpyxl")
+    start_row_idx, end_row_idx, start_col_idx, end_col_idx = handler.get_process_range(df.shape)
+    cache = []
+    for row_idx in range(start_row_idx, end_row_idx + 1):
+        for col_idx in range(start_col_idx, end_col_idx + 1):
+            cell_value = df.iloc[row_idx, col_idx]
+            if pd.isna(cell_value) or str(cell_value).strip() == "":
+                continue
+            cache.append(build_cache_entry(row_idx, col_idx, cell_value))
+    return cache
+
+
+# ========== 方案重算函数 ==========
+def splice_numbers(line, replacements):
+    """
+    按缓存的位置把新数字拼进行里，结果与按顺序逐个safe_replace_number相同
+    :param replacements: [(原数字, 位置, 新数字)]，按替换顺序
+    例外：新数字里含有后面要替换的原数字时（如99、99.5里的99），逐个替换可能落到新数字上，这种行退回逐个safe_replace_number
+    """
+    if any(span is None for _, span, _ in replacements) or \
+            any(later_num in new_num for idx, (_, _, new_num) in enumerate(replacements)
+                for later_num, _, _ in replacements[idx + 1:]):
+        for num_str, _, new_num in replacements:
+            line = handler.safe_replace_number(line, num_str, new_num)
+        return line
+    # 从右往左拼，前面的位置不受影响
+    for _, (start, end), new_num in sorted(replacements, key=lambda item: item[1][0], reverse=True):
+        line = line[:start] + new_num + line[end:]
+    return line
+
+
+def build_cell_state(cell, adjust_cfg, scope):
+    """
+    在缓存上按一个方案重算单个单元格（第一遍），逻辑与process_single_line/process_cell一致
+    （两者是否一致由check_pricing_parity.py在语料上对照检查）
+    :return: (单元格状态, 该格利润, 调整的数字个数)；单元格状态格式与process_cell填入的相同
+    """
+    diff_cache = {"diff": 0, "gufan_seen": False, "pending_plus": []}
+    new_lines = []
+    cell_margin = 0
+    adjusted_count = 0
+    for line_num, line_info in enumerate(cell["lines"], 1):
+        line = line_info["line"]
+        kind = line_info["kind"]
+        numbers = line_info["numbers"]
+        spans = line_info["spans"]
+        if kind == "unmatched":
+            line = "error"
+        elif kind == "pure_number":
+            new_num, actual_diff = handler.adjust_number(numbers[0], adjust_cfg)
+            if new_num:
+                line = new_num
+                cell_margin += actual_diff
+                adjusted_count += 1
+        elif kind == "gufan":
+            new_num, actual_diff = handler.adjust_number(numbers[0], adjust_cfg)
+            if new_num:
+                line = splice_numbers(line, [(numbers[0], spans[0], new_num)])
+                diff_cache["diff"] = actual_diff
+                diff_cache["gufan_seen"] = True
+                cell_margin += actual_diff
+                adjusted_count += 1
+        elif kind == "plus":
+            num2_str = numbers[1]
+            if diff_cache["diff"] > 0:
+                final_num, new_num2 = handler.round_price(float(num2_str) - diff_cache["diff"], adjust_cfg)
+                line = splice_numbers(line, [(num2_str, spans[1], new_num2)])
+                cell_margin += float(num2_str) - final_num
+                adjusted_count += 1
+            elif not diff_cache["gufan_seen"] and scope != "cell":
+                diff_cache["pending_plus"].append((line_num, num2_str))
+        elif kind == "rule":
+            replacements = []
+            for num_str, span in zip(numbers, spans):
+                new_num, actual_diff = handler.adjust_number(num_str, adjust_cfg)
+                if new_num:
+                    replacements.append((num_str, span, new_num))
+                    cell_margin += actual_diff
+                    adjusted_count += 1
+            if replacements:
+                line = splice_numbers(line, replacements)
+        new_lines.append(line)
+    cell_state = {"pos": cell["pos"], "lines": new_lines, "changed": False, **diff_cache}
+    return cell_state, cell_margin, adjusted_count
+
+
+def apply_scenario(cache, adjust_cfg):
+    """
+    在缓存上按一个方案重算：逐格做第一遍，再和正式处理一样按表格位置排成状态二维表，
+    交给resolve_gufan_dependencies做跨单元格的固反/加号处理
+    利润（margin）= 每个被调整数字的 原价 - 新价 之和
+    :return: (每格结果列表[(新内容, 该格利润)], 总利润, 调整的数字个数)
+    """
+    scope = handler.CONFIG["gufan_scope"]
+    states = []
+    margins = []
+    adjusted_count = 0
+    for cell in cache:
+        cell_state, cell_margin, cell_count = build_cell_state(cell, adjust_cfg, scope)
+        states.append(cell_state)
+        margins.append(cell_margin)
+        adjusted_count += cell_count
+
+    if cache:
+        first_row = min(cell["row_idx"] for cell in cache)
+        first_col = min(cell["col_idx"] for cell in cache)
+        row_count = max(cell["row_idx"] for cell in cache) - first_row + 1
+        col_count = max(cell["col_idx"] for cell in cache) - first_col + 1
+        cell_grid = [[None] * col_count for _ in range(row_count)]
+        for cell, cell_state in zip(cache, states):
+            cell_grid[cell["row_idx"] - first_row][cell["col_idx"] - first_col] = cell_state
+        # 跨单元格处理的逐行日志对模拟没有意义，丢弃
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            handler.resolve_gufan_dependencies(cell_grid, scope, adjust_cfg=adjust_cfg)
+
+    results = []
+    for idx, cell_state in enumerate(states):
+        for _, num2_str, final_num in cell_state.get("carried_plus", []):
+            margins[idx] += float(num2_str) - final_num
+            adjusted_count += 1
+        results.append(("\n".join(cell_state["lines"]), margins[idx]))
+    return results, sum(margins), adjusted_count
+
+
+def run_scenarios(cache, scenarios, target_path):
+    """逐个方案重算，打印利润对比并写出对比表"""
+    summary_rows = []
+    detail = {
+        "单元格": [cell["pos"] for cell in cache],
+        "原始内容": [cell["original"] for cell in cache],
+        "命中规则": ["\n".join(line["rule_desc"] or line["kind"] for line in cell["lines"]) for cell in cache]
+    }
+    start = time.perf_counter()
+    for scenario in scenarios:
+        adjust_cfg = scenario["adjust_config"]
+        results, total_margin, adjusted_count = apply_scenario(cache, adjust_cfg)
+        summary_rows.append({
+            "方案": scenario["name"],
+            "乘数": adjust_cfg["rate_value"],
+            "阈值": adjust_cfg["threshold"],
+            "减值": adjust_cfg["sub_value"],
+            "取整": adjust_cfg.get("rounding", "integer"),
+            "调整数字个数": adjusted_count,
+            "总利润": round(total_margin, 2)
+        })
+        detail[scenario["name"]] = [content for content, _ in results]
+        detail[f"{scenario['name']}_利润"] = [round(margin, 2) for _, margin in results]
+    elapsed = time.perf_counter() - start
+
+    print(f"\n📊 方案对比（{len(scenarios)}个方案，重算共耗时{elapsed * 1000:.1f}ms）：")
+    for row in summary_rows:
+        print(f"   {row['方案']}：乘{row['乘数']}，差值>{row['阈值']}减{row['减值']}，取整={row['取整']} → "
+              f"调整{row['调整数字个数']}个数字，总利润{row['总利润']}")
+
+    handler.clear_old_target_file(target_path)
+    with pd.ExcelWriter(target_path, engine="openpyxl") as writer:
+        pd.DataFrame(summary_rows).to_excel(writer, sheet_name="汇总", index=False)
+        pd.DataFrame(detail).to_excel(writer, sheet_name="明细", index=False)
+    print(f"✅ 对比表已保存至：{target_path}")
+
+
+# ========== 主函数 ==========
+def main():
+    current_dir = os.path.abspath(os.getcwd())
+    source_path = os.path.join(current_dir, SIM_CONFIG["source_file"])
+    scenario_path = os.path.join(current_dir, SIM_CONFIG["scenario_file"])
+    source_name, _ = os.path.splitext(SIM_CONFIG["source_file"])
+    target_path = os.path.join(current_dir, f"{source_name}{SIM_CONFIG['target_suffix']}.xlsx")
+    print("=" * 80)
+    print("📌 定价方案模拟")
+    print(f"   源文件：{source_path} | 方案文件：{scenario_path}")
+    print("=" * 80)
+
+    handler.check_file_exists(source_path, "源文件")
+    handler.check_file_exists(scenario_path, "方案文件")
+
+    # 分类阶段的逐行日志对模拟没有意义，丢弃
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        cache = build_cache(source_path)
+    print(f"\n🔍 解析完成：缓存{len(cache)}个单元格")
+
+    run_scenarios(cache, load_scenarios(scenario_path), target_path)
+    if not SIM_CONFIG["watch"]:
+        return
+
+    # 热加载：方案文件保存后只在缓存上重算
+    print(f"\n👀 正在监听方案文件（每{SIM_CONFIG['watch_interval']}秒检查一次，Ctrl+C退出）...")
+    last_mtime = os.path.getmtime(scenario_path)
+    try:
+        while True:
+            time.sleep(SIM_CONFIG["watch_interval"])
+            mtime = os.path.getmtime(scenario_path)
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            print(f"\n🔄 方案文件已修改，重新计算...")
+            try:
+                run_scenarios(cache, load_scenarios(scenario_path), target_path)
+            except Exception as e:
+                # 方案写错/结果文件被Excel占用时不退出，改好后继续
+                print(f"❌ 重算失败：{str(e)}")
+    except KeyboardInterrupt:
+        print("\n⏹️ 已停止监听")
+
+
+if __name__ == "__main__":
+    main()
+    print("\n🎉 脚本结束！")